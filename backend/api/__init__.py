@@ -1,4 +1,5 @@
 from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
 
 from .patients import router as patients_router
 from .train import router as train_router
@@ -11,7 +12,9 @@ from .importance import router as importance_router
 from .divergence import router as divergence_router
 from .delete_run import router as deletion_router
 
-router = APIRouter()
+# orjson serializes the large /dissect/embeddings and /eda payloads several
+# times faster than the stdlib json encoder
+router = APIRouter(default_response_class=ORJSONResponse)
 router.include_router(train_router)
 router.include_router(status_router)
 router.include_router(explore_router)
@@ -1,30 +1,154 @@
+import os
 import torch
+import logging
+import threading
+import numpy as np
 import pandas as pd
 from typing import Optional, List
 from pathlib import Path
+from functools import lru_cache
+from torch_geometric.nn import knn_graph
 from config.settings import Config
 from models.gnn_model import SAGENet
 from utils.blob_utils import load_file_from_blob_if_needed
-from data.preprocess import prepare_filtered_data
+from utils.prefetch import prefetch_dir
+from data.loader import build_knn_edge_index
+from data.preprocess import prepare_filtered_data, preprocess_data
 from data.io import load_protein_data, load_phenotype_data
+from utils.logging_utils import configure_logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+
+def _init_eval_model(state_dict: dict, input_dim: int, quantize: bool) -> SAGENet:
+    """Build an eval()'d SAGENet from a state_dict."""
+    model = SAGENet(in_dim=input_dim, hidden_dim=Config.hidden_dim, out_dim=Config.out_dim, dropout=Config.dropout)
+    model.load_state_dict(state_dict)
+    # The freshly built module starts on CPU regardless of where map_location
+    # put the checkpoint tensors; move it so it matches the device the
+    # inference inputs are staged on
+    model.to(torch.device(Config.device))
+    model.eval()
+    if quantize and Config.int8_dynamic_quantization and Config.device == "cpu":
+        # int8 GEMMs for the Linear layers; inference-only, so the weight
+        # precision loss is acceptable for the dashboard endpoints
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+@lru_cache(maxsize=32)
+def _load_model_cached(model_path: str, mtime: float, blob_key: str, input_dim: int, quantize: bool) -> SAGENet:
+    """Load an eval()'d SAGENet checkpoint, memoized on (path, mtime, blob_key).
+
+    The mtime key invalidates entries automatically when a checkpoint is
+    overwritten; /delete-run calls `.cache_clear()` for deleted runs.
+    """
+    checkpoint = torch.load(model_path, map_location=torch.device(Config.device))
+    return _init_eval_model(checkpoint["model_state_dict"], input_dim, quantize)
+
+
+@lru_cache(maxsize=8)
+def _load_client_bundle_cached(bundle_path: str, mtime: float) -> dict:
+    """Deserialize clients_bundle.pt once per (path, mtime); the per-client
+    model cache below pulls individual state_dicts out of the shared dict."""
+    return torch.load(bundle_path, map_location=torch.device(Config.device))["clients"]
+
+
+@lru_cache(maxsize=32)
+def _load_client_model_cached(bundle_path: str, mtime: float, client_name: str, input_dim: int, quantize: bool) -> SAGENet:
+    """Build one eval()'d client model from the bundle, memoized per entry."""
+    state_dict = _load_client_bundle_cached(bundle_path, mtime)[client_name]
+    return _init_eval_model(state_dict, input_dim, quantize)
+
 
 class AppContext:
     def __init__(self):
+        prefetch_dir(Config.model_dir)
         self.flwr_model_path = str(Config.model_dir / "flower_fl_model.pth")
         self.protein_df_raw = load_protein_data()
         self.phen_df_raw = load_phenotype_data()
         X_raw, Y_raw, self.merged_df, self.feature_cols = prepare_filtered_data(self.protein_df_raw, self.phen_df_raw, exclude_columns=['id', 'case_id'])
         self.protein_df = self.merged_df[self.feature_cols]
+        # Plain dict lookup is much cheaper than Series.get in per-patient loops
+        self.vital_status_by_id = self.merged_df["vital_status.demographic"].to_dict()
+        # NaN-cleaned float32 copy of the feature matrix plus a row lookup so
+        # /predict can slice a ready-to-use row without per-request copies
+        self.protein_np = np.nan_to_num(
+            self.protein_df.values.astype(np.float32), nan=0.0, posinf=0.0, neginf=0.0)
+        self.row_index = {pid: i for i, pid in enumerate(self.protein_df.index)}
         self.flwr_model = self._load_model(self.flwr_model_path, "saved_models/flower_fl_model.pth")
 
-    def _load_model(self, model_path, blob_key: str) -> SAGENet:
+        # Build the /eda payload eagerly so the first request is instant.
+        # Imported here to avoid a circular import through the api package.
+        from api.explore import build_eda_entries
+        self.eda_data = build_eda_entries(self.phen_df_raw)
+
+        # Preprocessed tensors for /dissect/feature-importance, built lazily
+        # (they depend only on the raw frames, never on request parameters)
+        self._inference_lock = threading.Lock()
+        self.X_inference_tensor: Optional[torch.Tensor] = None
+        self.y_inference_tensor: Optional[torch.Tensor] = None
+        self.edge_index_tensor: Optional[torch.Tensor] = None
+        self.class_names: Optional[List[str]] = None
+
+    def ensure_inference_graph(self) -> None:
+        """Build the preprocessed feature tensor and kNN edge_index once and cache them.
+
+        Both depend only on the raw protein/phenotype frames, so repeated
+        /dissect/feature-importance requests can reuse them.
+        """
+        if self.X_inference_tensor is not None:
+            return
+        with self._inference_lock:
+            if self.X_inference_tensor is not None:
+                return
+            X_processed_np, y_processed_np, class_names_list = preprocess_data(
+                protein_df=self.protein_df_raw, phen_df=self.phen_df_raw)
+            X_processed_np = X_processed_np.astype(np.float32)
+
+            X_tensor = torch.from_numpy(X_processed_np).to(Config.device)
+            try:
+                # knn_graph returns the [2, E] LongTensor directly on device,
+                # skipping the scipy CSR -> COO -> numpy -> tensor copies.
+                self.edge_index_tensor = knn_graph(X_tensor, k=Config.n_neighbors_knn_imputer, loop=False)
+            except ImportError:
+                # knn_graph needs the optional torch-cluster extension, which
+                # requirements.txt does not pin; reuse the FAISS/sklearn
+                # builder the client partitions go through instead
+                self.edge_index_tensor = build_knn_edge_index(X_processed_np, Config.n_neighbors_knn_imputer)
+            self.X_inference_tensor = X_tensor
+            self.y_inference_tensor = torch.from_numpy(np.asarray(y_processed_np)).to(Config.device)
+            self.class_names = class_names_list
+
+    def _load_model(self, model_path, blob_key: str, quantize: bool = True) -> SAGENet:
         if not isinstance(model_path, str):
             model_path = str(model_path)
         if Config.upload_to_blob:
             model_path = load_file_from_blob_if_needed(blob_key, model_path)
-        input_dim = len(self.feature_cols)
-        model = SAGENet(in_dim=input_dim, hidden_dim=Config.hidden_dim, out_dim=Config.out_dim, dropout=Config.dropout)
-        checkpoint = torch.load(model_path, map_location=torch.device(Config.device))
-        model.load_state_dict(checkpoint["model_state_dict"])
-        model.eval()
-        return model
\ No newline at end of file
+        mtime = os.path.getmtime(model_path)
+        return _load_model_cached(model_path, mtime, blob_key, len(self.feature_cols), quantize)
+
+    def _load_client_model(self, bundle_path, blob_key: str, client_name: str, quantize: bool = True) -> SAGENet:
+        """Load one client model (e.g. 'client_3') out of clients_bundle.pt.
+
+        Runs saved before the bundle format wrote one client_i_model.pt per
+        client; when the bundle is missing (or lacks the entry) fall back to
+        that per-client checkpoint so older runs stay readable.
+        """
+        if not isinstance(bundle_path, str):
+            bundle_path = str(bundle_path)
+        try:
+            if Config.upload_to_blob:
+                bundle_path = load_file_from_blob_if_needed(blob_key, bundle_path)
+            mtime = os.path.getmtime(bundle_path)
+            return _load_client_model_cached(bundle_path, mtime, client_name, len(self.feature_cols), quantize)
+        except Exception as e:
+            legacy_name = f"{client_name}_model.pt"
+            legacy_path = str(Path(bundle_path).with_name(legacy_name))
+            # blob_key is None when blob storage is disabled; only derive the
+            # legacy key when there is a real key to derive it from
+            legacy_blob_key = f"{blob_key.rsplit('/', 1)[0]}/{legacy_name}" if blob_key else None
+            logger.info(f"clients_bundle.pt unavailable for {client_name} ({e}); "
+                        f"trying legacy checkpoint {legacy_name}")
+            return self._load_model(legacy_path, legacy_blob_key, quantize)
\ No newline at end of file
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import shutil
 from fastapi import APIRouter, Request
@@ -5,7 +6,9 @@ from fastapi import APIRouter, Request
 from config.settings import Config
 from utils.blob_utils import delete_run_from_blob
 from utils.logging_utils import configure_logging
+from api.context import _load_model_cached, _load_client_bundle_cached, _load_client_model_cached
 from api.status import RunIdRequest
+from utils.metadata import _read_metadata_cached
 
 configure_logging()
 logger = logging.getLogger(__name__)
@@ -17,14 +20,19 @@ async def delete_run(request: Request, req: RunIdRequest):
     run_id = req.run_id.strip()
     try:
         if Config.upload_to_blob:
-            delete_run_from_blob(run_id)
+            # Offloaded so the blocking blob HTTP calls don't stall the event loop
+            await asyncio.to_thread(delete_run_from_blob, run_id)
             logger.info(f"Deleted blob for runId: {run_id}")
 
         # Also delete local copy if exists
         run_folder = Config.model_dir / run_id
 
         if run_folder.exists():
-            shutil.rmtree(run_folder)
+            await asyncio.to_thread(shutil.rmtree, run_folder)
+        _load_model_cached.cache_clear()
+        _load_client_model_cached.cache_clear()
+        _load_client_bundle_cached.cache_clear()
+        _read_metadata_cached.cache_clear()
         logger.info(f"Deleted local folder for runId: {run_id}")
         return {"status": "deleted"}
     except Exception as e:
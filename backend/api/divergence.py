@@ -1,5 +1,7 @@
+import asyncio
 import json
 import logging
+import orjson
 from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel, RootModel
 from typing import Dict, Optional, List
@@ -22,7 +24,7 @@ class DivergenceHistoryResponse(RootModel[List[RoundDivergenceData]]):
     pass
 
 @router.get("/dissect/divergence-history", response_model=DivergenceHistoryResponse)
-def get_divergence_history(
+async def get_divergence_history(
     request: Request,
     run_id: Optional[str] = None
     ):
@@ -39,18 +41,20 @@ def get_divergence_history(
     path = current_model_dir / "_divergence_metrics.json"
     
     try:
-        local_path = path if not Config.upload_to_blob else load_file_from_blob_if_needed(blob_key, str(path))
+        # Blob download is blocking I/O; run it off the event loop
+        local_path = path if not Config.upload_to_blob else await asyncio.to_thread(
+            load_file_from_blob_if_needed, blob_key, str(path))
 
     except Exception as e:
         logger.warning(f"Divergence metrics file not found: {e}")
         raise HTTPException(status_code=404, detail="Divergence metrics file not found.")
 
     try:
-        with open(local_path, "r") as f:
-            data = json.load(f)
+        raw = await asyncio.to_thread(Path(local_path).read_bytes)
+        data = orjson.loads(raw)
         response = DivergenceHistoryResponse.model_validate(data)
         return response
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         logger.error(f"Error decoding JSON from divergence metrics file at {path}: {e}")
         raise HTTPException(status_code=500, detail="Error loading divergence metrics data.")
     except Exception as e:
@@ -4,11 +4,12 @@ import umap
 import gc
 import numpy as np
 import pandas as pd
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel
-from typing import Dict, List, Optional
+from sklearn.decomposition import PCA
+from typing import Dict, List, Literal, Optional
 from functools import lru_cache
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from utils.embedding import extract_patient_embeddings
 from utils.blob_utils import load_file_from_blob_if_needed
 from utils.logging_utils import configure_logging
@@ -32,7 +33,8 @@ class DissectEmbeddingsResponse(BaseModel):
 @router.get("/dissect/embeddings", response_model=DissectEmbeddingsResponse)
 def get_dissection_embeddings(
     request: Request,
-    run_id: Optional[str] = None
+    run_id: Optional[str] = None,
+    reducer: Optional[Literal["umap", "pca"]] = None
     ):
     ctx = request.app.state.ctx
 
@@ -52,7 +54,8 @@ def get_dissection_embeddings(
         current_model_dir = Config.model_dir
 
     global_model_path = current_model_dir / "global_model_manual.pt"
-    model_paths = {"global": global_model_path}
+    bundle_path = current_model_dir / "clients_bundle.pt"
+    bundle_blob_key = f"{blob_prefix}/clients_bundle.pt"
     metadata_path = current_model_dir / f"_train_metadata.json"
 
     if not metadata_path.exists():
@@ -60,62 +63,93 @@ def get_dissection_embeddings(
         if Config.upload_to_blob:
             metadata_blob_key = f"{blob_prefix}/_train_metadata.json"
             metadata_path = load_file_from_blob_if_needed(metadata_blob_key, str(metadata_path))
-    
+
     num_clients_trained, num_rounds_trained = load_metadata(metadata_path)
 
-    for i in range(1, 1 + num_clients_trained):
-        model_paths[f"client_{i}"] = current_model_dir / f"client_{i}_model.pt"
+    model_names = ["global"] + [f"client_{i}" for i in range(1, 1 + num_clients_trained)]
 
-    label_map = ctx.merged_df["vital_status.demographic"].loc[ctx.protein_df.index]
+    label_map = ctx.vital_status_by_id
     embedding_model_map = []
     combined_embeddings = None
 
-    for model_name, path in model_paths.items():
-        blob_key = f"{blob_prefix}/{path.name}"
-        if not path.exists() and Config.upload_to_blob:
-            try:
-                # Attempt to download from blob
-                path = load_file_from_blob_if_needed(blob_key, str(path))
-            except Exception as e:
-                logger.warning(f"Model file not found for {model_name} at {path} (blob: {blob_key}): {e}")
-                logger.warning(f"Directory contents: {list(Path(path.parent).iterdir())}")
-                continue
-
+    def _load_and_embed(model_name):
+        """Load one model (global checkpoint or bundle entry) and extract embeddings."""
         try:
-            model = ctx._load_model(path, blob_key)
-            logger.info(f"Loading and extracting embeddings from {model_name}...")
-            embedding_df = extract_patient_embeddings(model=model, protein_df=ctx.protein_df)
-
-            embedding_array = embedding_df.values.astype(np.float32)
-            if combined_embeddings is None:
-                combined_embeddings = embedding_array
+            if model_name == "global":
+                model = ctx._load_model(global_model_path, f"{blob_prefix}/{global_model_path.name}")
             else:
-                combined_embeddings = np.concatenate((combined_embeddings, embedding_array), axis=0)
-
-            # all_raw_embeddings_list.append(embedding_df.values)
-            embedding_model_map.append({
-                "model_name": model_name,
-                "count": len(embedding_df),
-                "patient_ids": embedding_df.index.tolist()
-            })
-
+                # Client models all live in one bundle, so the download and
+                # deserialize are shared across the client names
+                model = ctx._load_client_model(bundle_path, bundle_blob_key, model_name)
+            logger.info(f"Loading and extracting embeddings from {model_name}...")
+            return extract_patient_embeddings(model=model, protein_df=ctx.protein_df)
         except Exception as e:
-            logger.error(f"Unexpected error for {model_name} at {path} (blob: {blob_key}): {e}")
-
-    if combined_embeddings.shape[0] == 0 or combined_embeddings.shape[1] == 0:
+            logger.warning(f"Could not load model {model_name} (bundle: {bundle_path}): {e}")
+            return None
+
+    # Blob downloads are I/O-bound and the torch forward passes release the
+    # GIL, so the per-model work overlaps well across threads.
+    max_workers = min(8, len(model_names))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {name: executor.submit(_load_and_embed, name) for name in model_names}
+
+    # Every model embeds the same patients, so the final shape is known once
+    # the first extraction reveals the embedding dim; preallocate and fill
+    # slices instead of re-concatenating (which copies all prior rows).
+    num_patients = len(ctx.protein_df)
+    filled_rows = 0
+    for model_name in model_names:
+        embedding_df = futures[model_name].result()
+        if embedding_df is None:
+            continue
+
+        embedding_array = embedding_df.values.astype(np.float32)
+        if combined_embeddings is None:
+            emb_dim = embedding_array.shape[1]
+            combined_embeddings = np.empty((len(model_names) * num_patients, emb_dim), dtype=np.float32)
+        combined_embeddings[filled_rows : filled_rows + len(embedding_array)] = embedding_array
+        filled_rows += len(embedding_array)
+
+        embedding_model_map.append({
+            "model_name": model_name,
+            "count": len(embedding_df),
+            "patient_ids": embedding_df.index.tolist()
+        })
+
+    if combined_embeddings is not None:
+        combined_embeddings = combined_embeddings[:filled_rows]
+
+    if combined_embeddings is None or combined_embeddings.shape[0] == 0 or combined_embeddings.shape[1] == 0:
         logger.warning("No embeddings extracted from any models. Returning empty.")
         return DissectEmbeddingsResponse(embeddings={})
 
     embedding_2d_combined = None
     try:
-        reducer = umap.UMAP(n_neighbors=12, min_dist=0.1, random_state=10, low_memory=True)
-        embedding_2d_combined = reducer.fit_transform(combined_embeddings)
-        logger.info("UMAP fitting and transformation complete.")
+        if reducer is None:
+            # UMAP's iterative kNN + optimization dominates the endpoint for
+            # large inputs; fall back to PCA (one BLAS pass) beyond the cutoff.
+            reducer = "umap" if combined_embeddings.shape[0] <= Config.umap_max_samples else "pca"
+
+        if reducer == "pca":
+            embedding_2d_combined = PCA(n_components=2, random_state=10).fit_transform(combined_embeddings)
+            logger.info("PCA fitting and transformation complete.")
+        else:
+            umap_reducer = None
+            if torch.cuda.is_available():
+                try:
+                    from cuml.manifold import UMAP as CumlUMAP
+                    umap_reducer = CumlUMAP(n_neighbors=12, min_dist=0.1, random_state=10)
+                except ImportError:
+                    pass
+            if umap_reducer is None:
+                umap_reducer = umap.UMAP(n_neighbors=12, min_dist=0.1, random_state=10, low_memory=True)
+            embedding_2d_combined = umap_reducer.fit_transform(combined_embeddings)
+            logger.info("UMAP fitting and transformation complete.")
     except Exception as e:
-        logger.error(f"UMAP fitting failed: {e}")
-        raise HTTPException(status_code=500, detail=f"UMAP fitting failed: {e}")
+        logger.error(f"Dimensionality reduction failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Dimensionality reduction failed: {e}")
 
-    del model, combined_embeddings
+    del combined_embeddings
 
     final_results: Dict[str, List[EmbeddingPoint]] = {}
     current_idx = 0
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Request
 from pydantic import BaseModel
 from typing import List, Literal, Optional
+import numpy as np
 import pandas as pd
 import os
-from config.settings import Config 
+from config.settings import Config
 from data.io import load_phenotype_data
 
 router = APIRouter()
@@ -14,18 +15,8 @@ class PatientEntry(BaseModel):
     stage: str
     status: Literal["Alive", "Dead"]
 
-# Module-level cache
-cached_eda_data: Optional[List[PatientEntry]] = None
-
-@router.get("/eda", response_model=List[PatientEntry])
-def get_patient_eda_data(request: Request):
-    global cached_eda_data
-    if cached_eda_data is not None:
-        return cached_eda_data
-
-    ctx = request.app.state.ctx
-    phen_df = ctx.phen_df_raw
-
+def build_eda_entries(phen_df: pd.DataFrame) -> List[PatientEntry]:
+    """Build the /eda payload once with vectorized pandas ops."""
     required_cols = ["id", "vital_status.demographic", "age_at_index.demographic", "ajcc_pathologic_stage.diagnoses"]
     for col in required_cols:
         if col not in phen_df.columns:
@@ -33,20 +24,17 @@ def get_patient_eda_data(request: Request):
 
     df = phen_df[required_cols].dropna()
 
-    def map_to_main_stage(stage_raw):
-        stage_raw = str(stage_raw).strip().upper()
-        if "IV" in stage_raw:
-            return "Stage IV"
-        elif "III" in stage_raw:
-            return "Stage III"
-        elif "II" in stage_raw:
-            return "Stage II"
-        elif "I" in stage_raw:
-            return "Stage I"
-        return None
-
-    df["stage_mapped"] = df["ajcc_pathologic_stage.diagnoses"].apply(map_to_main_stage)
-    df = df[df["stage_mapped"].isin(["Stage I", "Stage II", "Stage III", "Stage IV"])]
+    # Order matters: "IV" must be checked before "III"/"II"/"I"
+    stage_raw = df["ajcc_pathologic_stage.diagnoses"].astype(str).str.strip().str.upper()
+    conditions = [
+        stage_raw.str.contains("IV", regex=False),
+        stage_raw.str.contains("III", regex=False),
+        stage_raw.str.contains("II", regex=False),
+        stage_raw.str.contains("I", regex=False),
+    ]
+    choices = ["Stage IV", "Stage III", "Stage II", "Stage I"]
+    df["stage_mapped"] = np.select(conditions, choices, default=None)
+    df = df[df["stage_mapped"].isin(choices)]
 
     df["status_mapped"] = df["vital_status.demographic"].str.strip().str.lower().map({
         "alive": "Alive",
@@ -54,14 +42,13 @@ def get_patient_eda_data(request: Request):
     })
     df = df[df["status_mapped"].isin(["Alive", "Dead"])]
 
-    # Convert to list of Pydantic objects
-    cached_eda_data = [
-        PatientEntry(
-            id=row["id"],
-            age=row["age_at_index.demographic"],
-            stage=row["stage_mapped"],
-            status=row["status_mapped"]
-        )
-        for _, row in df.iterrows()
-    ]
-    return cached_eda_data
+    records = (
+        df[["id", "age_at_index.demographic", "stage_mapped", "status_mapped"]]
+        .rename(columns={"age_at_index.demographic": "age", "stage_mapped": "stage", "status_mapped": "status"})
+        .to_dict(orient="records")
+    )
+    return [PatientEntry.model_validate(record) for record in records]
+
+@router.get("/eda", response_model=List[PatientEntry])
+def get_patient_eda_data(request: Request):
+    return request.app.state.ctx.eda_data
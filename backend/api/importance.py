@@ -5,15 +5,14 @@ import gc
 import torch.nn.functional as F
 import numpy as np
 from captum.attr import Saliency
-from sklearn.neighbors import kneighbors_graph
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import FrozenSet, List, Optional, Tuple
 from pathlib import Path
 from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel
 from utils.blob_utils import load_file_from_blob_if_needed
 from utils.logging_utils import configure_logging
 from config.settings import Config
-from data.preprocess import preprocess_data
 from api.context import AppContext
 
 configure_logging()
@@ -42,32 +41,45 @@ def calculate_saliency_and_top_features(
     k_features: int,
     ctx: AppContext,
     blob_key: str = None,
-) -> List[FeatureImportanceEntry]:
+    client_name: str = None,
+) -> Tuple[List[FeatureImportanceEntry], FrozenSet[str]]:
     try:
-        if blob_key and Config.upload_to_blob:
-            current_model_path = load_file_from_blob_if_needed(blob_key, current_model_path)
-        model = ctx._load_model(current_model_path, blob_key)
+        # Saliency backprops to the inputs, so keep the FP32 models here
+        if client_name is not None:
+            # Client models live in clients_bundle.pt; the loader shares one
+            # download/deserialize of the bundle across entries
+            model = ctx._load_client_model(current_model_path, blob_key, client_name, quantize=False)
+        else:
+            if blob_key and Config.upload_to_blob:
+                current_model_path = load_file_from_blob_if_needed(blob_key, current_model_path)
+            model = ctx._load_model(current_model_path, blob_key, quantize=False)
 
         saliency = Saliency(model)
-        input_tensor_for_saliency = X_tensor.clone().detach().requires_grad_(True).to(Config.device)
-        
+        # Single copy onto the target device instead of clone + separate .to()
+        input_tensor_for_saliency = X_tensor.detach().to(Config.device, copy=True).requires_grad_(True)
+
         with torch.no_grad():
             logits = model(input_tensor_for_saliency, edge_index=edge_index_tensor)
             predicted_classes = torch.argmax(F.softmax(logits, dim=1), dim=1)
 
         attributions = saliency.attribute(input_tensor_for_saliency, target=predicted_classes)
-        feature_attributions_mean = attributions.abs().mean(dim=0)
-        
-        importance_scores = {}
-        for i, feature_name in enumerate(feature_column_names):
-            importance_scores[feature_name] = feature_attributions_mean[i].item()
-
-        sorted_features = sorted(importance_scores.items(), key=lambda item: item[1], reverse=True)
-        
+        # In-place abs: the attributions tensor is ours, so skip the extra
+        # full-size intermediate before the mean reduction
+        feature_attributions_mean = attributions.abs_().mean(dim=0)
+
+        # topk on the tensor + one .cpu() transfer instead of a per-feature
+        # .item() sync and a Python sort over all features
+        k = min(k_features, feature_attributions_mean.numel())
+        top_vals, top_idx = torch.topk(feature_attributions_mean, k=k)
+        top_vals = top_vals.detach().cpu().tolist()
+        top_idx = top_idx.detach().cpu().tolist()
+
         del model, input_tensor_for_saliency, saliency, logits, attributions
         gc.collect()
 
-        return [{"feature_name": k, "importance": v} for k, v in sorted_features[:k_features]]
+        entries = [{"feature_name": feature_column_names[i], "importance": v} for i, v in zip(top_idx, top_vals)]
+        # Hand back the name set too so the overlap computation doesn't rescan
+        return entries, frozenset(feature_column_names[i] for i in top_idx)
     except Exception as e:
         logger.error(f"Error calculating saliency for model {current_model_path}: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing model {current_model_path}: {e}")
@@ -82,23 +94,9 @@ def get_feature_importance(
     ):
     try:
         ctx = request.app.state.ctx
-
-        X_processed_np, y_processed_np, class_names_list = preprocess_data(
-                protein_df=ctx.protein_df_raw, phen_df=ctx.phen_df_raw)
-        logger.info("Data prepared and preprocessed locally for this request.")
-        X_processed_np = X_processed_np.astype(np.float32)
-
-        adjacency_matrix = kneighbors_graph(
-                X_processed_np, 
-                n_neighbors=Config.n_neighbors_knn_imputer, 
-                mode='connectivity', 
-                include_self=False,
-                metric='euclidean'
-            )
-        coo_matrix = adjacency_matrix.tocoo()
-        edge_index_np = np.stack([coo_matrix.row, coo_matrix.col], axis=0).astype(np.int64)
-        edge_index_tensor_local = torch.from_numpy(edge_index_np).long().to(Config.device)
-        logger.info("Graph edge_index created locally.")
+        ctx.ensure_inference_graph()
+        edge_index_tensor_local = ctx.edge_index_tensor
+        logger.info("Using cached preprocessed tensors and graph edge_index from AppContext.")
 
     except Exception as e:
         logger.error(f"Error during data loading/preprocessing/graph creation: {e}")
@@ -117,50 +115,63 @@ def get_feature_importance(
         if Config.upload_to_blob:
             blob_key = f"{blob_prefix}/global_model_manual.pt"
     else:
-        client_id = model_name.split('_')[-1]
-        current_model_path = current_model_dir / f"client_{client_id}_model.pt"
+        current_model_path = current_model_dir / "clients_bundle.pt"
         global_model_path = current_model_dir / "global_model_manual.pt"
         if Config.upload_to_blob:
-            blob_key = f"{blob_prefix}/client_{client_id}_model.pt"
+            blob_key = f"{blob_prefix}/clients_bundle.pt"
             global_blob_key = f"{blob_prefix}/global_model_manual.pt"
 
-    X_inference_tensor_local = torch.tensor(X_processed_np, dtype=torch.float32).to(Config.device)
-
-    current_model_importances = calculate_saliency_and_top_features(
-        current_model_path,
-        X_inference_tensor_local,
-        edge_index_tensor_local,
-        ctx.feature_cols,
-        top_k,
-        ctx,
-        blob_key,
-    )
+    X_inference_tensor_local = ctx.X_inference_tensor
 
     overlap_data: Optional[FeatureOverlap] = None
-    if model_name != "global":
-        global_model_importances = calculate_saliency_and_top_features(
-            global_model_path,
+    if model_name == "global":
+        current_model_importances, _ = calculate_saliency_and_top_features(
+            current_model_path,
             X_inference_tensor_local,
             edge_index_tensor_local,
             ctx.feature_cols,
             top_k,
             ctx,
-            global_blob_key
+            blob_key,
         )
-        global_top_features_names = {entry["feature_name"] for entry in global_model_importances}
-        current_client_top_features_names = {entry["feature_name"] for entry in current_model_importances}
-        common_features = list(global_top_features_names.intersection(current_client_top_features_names))
-        
+    else:
+        # Both saliency passes are GIL-releasing GNN backward passes, so
+        # run the client and global computations concurrently
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            future_current = executor.submit(
+                calculate_saliency_and_top_features,
+                current_model_path,
+                X_inference_tensor_local,
+                edge_index_tensor_local,
+                ctx.feature_cols,
+                top_k,
+                ctx,
+                blob_key,
+                model_name,
+            )
+            future_global = executor.submit(
+                calculate_saliency_and_top_features,
+                global_model_path,
+                X_inference_tensor_local,
+                edge_index_tensor_local,
+                ctx.feature_cols,
+                top_k,
+                ctx,
+                global_blob_key,
+            )
+            current_model_importances, current_feature_names = future_current.result()
+            _, global_feature_names = future_global.result()
+        common_features = current_feature_names & global_feature_names
+
         # Calculate overlap percentage, handle division by zero if top_k is 0
         overlap_percentage = (len(common_features) / top_k) * 100 if top_k > 0 else 0.0
         overlap_data = FeatureOverlap(
             overlap_percentage=round(overlap_percentage, 2),
-            common_features=common_features
+            common_features=sorted(common_features)
         )
         logger.info(f"Overlap with global model calculated: {overlap_percentage:.2f}%")
 
 
-    del X_inference_tensor_local, edge_index_tensor_local, adjacency_matrix, coo_matrix, edge_index_np
     gc.collect()
 
     logger.info(f"Feature importance calculated for {model_name}. Top {top_k} features retrieved.")
@@ -3,6 +3,7 @@ from pydantic import BaseModel
 import json
 from config.settings import Config
 from utils.blob_utils import download_file_from_blob
+from utils.metadata import load_metadata_dict
 
 router = APIRouter()
 
@@ -24,7 +25,6 @@ def get_train_metadata(request: Request, run_id: str = Query(default=None)):
         except Exception as e:
             raise HTTPException(status_code=404, detail="Metadata file not found.")
 
-    with open(str(path), "r") as f:
-        raw = json.load(f)
+    raw = load_metadata_dict(path)
 
     return TrainMetadata(**raw)
\ No newline at end of file
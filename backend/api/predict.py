@@ -1,31 +1,91 @@
 from fastapi import APIRouter, Request, HTTPException
+import asyncio
 import torch
 import torch.nn.functional as F
 import numpy as np
 from pydantic import BaseModel
+from config.settings import Config
 
 router = APIRouter()
 
 class PatientConfig(BaseModel):
     patient_id: str
 
+
+class PredictionBatcher:
+    """Aggregate concurrent /predict requests into one batched forward pass.
+
+    Requests arriving within MAX_WAIT_MS of each other (up to MAX_BATCH) are
+    stacked and run through the model once; results are fanned back out via
+    per-request futures.
+    """
+    MAX_BATCH = 32
+    MAX_WAIT_MS = 10
+
+    def __init__(self):
+        self._queue: asyncio.Queue = None
+        self._worker_task = None
+
+    async def submit(self, model, x_tensor: torch.Tensor) -> np.ndarray:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._worker_task = asyncio.get_running_loop().create_task(self._worker())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((model, x_tensor, future))
+        return await future
+
+    async def _worker(self):
+        while True:
+            model, x, future = await self._queue.get()
+            batch = [(model, x, future)]
+            deadline = asyncio.get_running_loop().time() + self.MAX_WAIT_MS / 1000.0
+            while len(batch) < self.MAX_BATCH:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                stacked = torch.cat([entry[1] for entry in batch], dim=0)
+                probs = await asyncio.to_thread(self._forward, batch[0][0], stacked)
+                for i, (_, _, fut) in enumerate(batch):
+                    if not fut.done():
+                        fut.set_result(probs[i])
+            except Exception as e:
+                for _, _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    @staticmethod
+    def _forward(model, stacked: torch.Tensor) -> np.ndarray:
+        # Models are served on Config.device; the queued rows are CPU views,
+        # so stage the batch up and bring the probabilities back down
+        with torch.no_grad():
+            logits = model(stacked.to(Config.device), edge_index=None)
+            return F.softmax(logits, dim=1).cpu().numpy()
+
+
+_batcher = PredictionBatcher()
+
+
 @router.post("/predict")
-def predict(request: Request, req: PatientConfig):
+async def predict(request: Request, req: PatientConfig):
     pid = req.patient_id.strip()
     ctx = request.app.state.ctx
 
-    if pid not in ctx.protein_df.index:
+    row = ctx.row_index.get(pid)
+    if row is None:
         raise HTTPException(status_code=404, detail=f"Patient ID '{pid}' not found")
 
-    x = ctx.protein_df.loc[pid].values.astype(np.float32).reshape(1, -1)
-    x = np.nan_to_num(x, nan=0.0, posinf=0.0, neginf=0.0)
-    x_tensor = torch.tensor(x, dtype=torch.float32)
+    # Zero-copy view into the NaN-cleaned float32 matrix built at startup
+    x_tensor = torch.from_numpy(ctx.protein_np[row : row + 1])
 
-    with torch.no_grad():
-        logits = ctx.flwr_model(x_tensor, edge_index=None)
-        probs = F.softmax(logits, dim=1).numpy()[0]
-        pred_class = int(np.argmax(probs))
-        confidence = float(probs[pred_class])
+    probs = await _batcher.submit(ctx.flwr_model, x_tensor)
+    pred_class = int(np.argmax(probs))
+    confidence = float(probs[pred_class])
 
     return {
         "patient_id": pid,
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Request
 from pathlib import Path
 from pydantic import BaseModel
 from config.settings import Config
+from utils.prefetch import prefetch_dir
 
 router = APIRouter()
 
@@ -13,4 +14,7 @@ def get_analysis_status(request: Request, run_id: str):
     run_id = run_id.strip()
     model_dir = Config.model_dir / run_id
     is_ready = model_dir.exists() and any(model_dir.iterdir())
+    if is_ready:
+        # Warm the page cache so the first /dissect request doesn't stall on disk
+        prefetch_dir(model_dir)
     return {"ready": is_ready}
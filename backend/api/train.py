@@ -1,11 +1,11 @@
 import json
-import time
+import asyncio
 import logging
 from fastapi import APIRouter, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Generator
+from typing import AsyncGenerator
 from data.loader import load_and_partition_data
 from utils.logging_utils import configure_logging
 from trainer.manual_simulation import run_manual_simulation
@@ -31,7 +31,7 @@ async def stream_training(request: Request, req: TrainConfig):
 
     run_id = f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
 
-    async def training_generator() -> Generator[str, None, None]:
+    async def training_generator() -> AsyncGenerator[bytes, None]:
         try:
             for round_result in run_manual_simulation(
                 client_datasets=client_datasets,
@@ -42,8 +42,10 @@ async def stream_training(request: Request, req: TrainConfig):
                 run_id=run_id,
             ):
                 round_result['run_id'] = run_id
-                yield json.dumps(round_result) + "\n"
-                time.sleep(0.5)
+                yield (json.dumps(round_result) + "\n").encode()
+                # Yield control so other requests aren't starved between rounds;
+                # no artificial pacing delay
+                await asyncio.sleep(0)
         except Exception as e:
             logger.error(f"Error in training_generator: {str(e)}")
             raise
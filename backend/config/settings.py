@@ -1,11 +1,12 @@
 import os
+import torch
 from pathlib import Path
 
 class Config:
     # General settings
     parent_dir = Path(__file__).resolve().parent.parent
     model_dir = parent_dir / "saved_models"
-    device = "cpu"
+    device = "cuda" if torch.cuda.is_available() else "cpu"
     
     # Data preprocessing
     n_neighbors_knn_imputer = 5
@@ -19,6 +20,19 @@ class Config:
     local_epochs = 4
     label_map = {'Alive': 1, 'Dead': 0}
 
+    # Dynamic int8 quantization of Linear layers for CPU inference
+    # (/predict, /dissect/embeddings); disable to compare accuracy
+    int8_dynamic_quantization = True
+
+    # Embedding visualization: above this many rows, /dissect/embeddings
+    # falls back from UMAP to PCA unless a reducer is requested explicitly
+    umap_max_samples = 5000
+
+    # Above this many nodes a client trains on sampled k-hop subgraphs
+    # around its train nodes (NeighborLoader) instead of full-batch passes
+    neighbor_sampling_threshold = 2000
+    batch_size = 256
+
     # Model hyperparameters
     dropout = 0.5
     weight_decay = 1e-3
@@ -1,6 +1,10 @@
 import os
+import gzip
 import logging
+import urllib.request
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from pathlib import Path
 from config.settings import Config
 from utils.blob_utils import upload_file_to_blob, download_file_from_blob
@@ -10,64 +14,88 @@ configure_logging()
 logger = logging.getLogger(__name__)
 
 def load_protein_data():
-    """Load protein expression data from local CSV cache if available, else get it from blob and cache."""
-    filepath = os.path.join(Config.parent_dir, 'raw_data/protein_data.csv')
+    """Load protein expression data from local Parquet cache if available, else get it from blob and cache."""
+    filepath = os.path.join(Config.parent_dir, 'raw_data/protein_data.parquet')
+    legacy_csv = os.path.join(Config.parent_dir, 'raw_data/protein_data.csv')
 
-    if not os.path.exists(filepath):
+    if os.path.exists(filepath):
+        logger.info("Loading cached protein data...")
+        protein_df = pd.read_parquet(filepath, engine='pyarrow')
+    elif os.path.exists(legacy_csv):
+        # Migrate an existing CSV cache to the typed columnar format once
+        logger.info("Migrating cached protein CSV to Parquet...")
+        protein_df = pd.read_csv(legacy_csv, index_col=0, encoding='utf-8')
+        protein_df.to_parquet(filepath, engine='pyarrow', compression='zstd')
+    else:
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
         logger.info("Local protein data not found, downloading from blob...")
-        blob_key = "saved_models/raw_data/protein_data.csv"  
+        blob_key = "saved_models/raw_data/protein_data.parquet"
 
         try:
             download_file_from_blob(blob_key, str(filepath))
+            protein_df = pd.read_parquet(filepath, engine='pyarrow')
         except Exception as e:
             logger.error(f"Failed to download protein data from blob: {e}, falling back to remote URL.")
-            
+
             url = "https://gdc-hub.s3.us-east-1.amazonaws.com/download/TCGA-BRCA.protein.tsv.gz"
-            protein_df = pd.read_csv(
-                url,
-                sep='\t',
-                compression='gzip',
-                index_col='peptide_target',
-                low_memory=False
-            )
-            protein_df.to_csv(filepath, encoding='utf-8')
+            # Multithreaded arrow parse of the gzip stream instead of pandas'
+            # single-threaded tokenizer
+            with urllib.request.urlopen(url) as response, gzip.open(response) as stream:
+                table = pacsv.read_csv(
+                    stream,
+                    parse_options=pacsv.ParseOptions(delimiter='\t'),
+                    read_options=pacsv.ReadOptions(use_threads=True, block_size=1 << 23),
+                )
+            # Downstream consumes fp32 anyway; pin the expression columns to
+            # float32 here so the Parquet cache and every later load carry
+            # half the bytes instead of inferred fp64
+            schema = pa.schema([
+                field if field.name == 'peptide_target' else pa.field(field.name, pa.float32())
+                for field in table.schema
+            ])
+            protein_df = table.cast(schema).to_pandas().set_index('peptide_target')
+            protein_df.to_parquet(filepath, engine='pyarrow', compression='zstd')
             upload_file_to_blob(blob_key, str(filepath))
             logger.info(f"Uploaded protein data to blob with key: {blob_key}")
-    else:
-        logger.info("Loading cached protein data...")
-        protein_df = pd.read_csv(filepath, index_col=0, encoding='utf-8')
-    
+
     logger.info(f"Loaded protein data shape: {protein_df.shape}")
-    protein_df.index = protein_df.index.astype(str).str.strip()
-    protein_df = protein_df.T
+    # Wrap a transposed NumPy view instead of DataFrame.T, which would copy
+    # the whole (peptides x samples) block into a new row-major layout
+    peptide_ids = protein_df.index.astype(str).str.strip()
+    sample_ids = protein_df.columns
+    protein_df = pd.DataFrame(protein_df.to_numpy().T, index=sample_ids, columns=peptide_ids, copy=False)
 
     return protein_df
 
 def load_phenotype_data():
-    """Load phenotype data from local CSV cache if available, else get it from blob and cache."""
-    filepath = os.path.join(Config.parent_dir, 'raw_data/phenotype_data.csv')
+    """Load phenotype data from local Parquet cache if available, else get it from blob and cache."""
+    filepath = os.path.join(Config.parent_dir, 'raw_data/phenotype_data.parquet')
+    legacy_csv = os.path.join(Config.parent_dir, 'raw_data/phenotype_data.csv')
 
-    if not os.path.exists(filepath):
+    if os.path.exists(filepath):
+        logger.info("Loading cached phenotype data...")
+        phen_df = pd.read_parquet(filepath, engine='pyarrow')
+    elif os.path.exists(legacy_csv):
+        logger.info("Migrating cached phenotype CSV to Parquet...")
+        phen_df = pd.read_csv(legacy_csv, index_col=0, encoding='utf-8')
+        phen_df.to_parquet(filepath, engine='pyarrow', compression='zstd')
+    else:
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
         logger.info("Local phenotype data not found, downloading from blob...")
-        blob_key = "raw_data/phenotype_data.csv"
+        blob_key = "raw_data/phenotype_data.parquet"
 
         try:
             download_file_from_blob(blob_key, str(filepath))
+            phen_df = pd.read_parquet(filepath, engine='pyarrow')
         except Exception as e:
             logger.error(f"Failed to download phenotype data from blob: {e}, falling back to remote URL.")
-            
+
             url = "https://gdc-hub.s3.us-east-1.amazonaws.com/download/TCGA-BRCA.clinical.tsv.gz"
             phen_df = pd.read_csv(url, sep='\t', index_col=0)
-            phen_df.to_csv(filepath, index=True, encoding='utf-8')
+            phen_df.to_parquet(filepath, engine='pyarrow', compression='zstd')
             upload_file_to_blob(blob_key, str(filepath))
             logger.info(f"Uploaded phenotype data to blob with key: {blob_key}")
 
-    else:
-        logger.info("Loading cached phenotype data...")
-        phen_df = pd.read_csv(filepath, index_col=0, encoding='utf-8')
-        
     logger.info(f"Loaded phenotype data shape: {phen_df.shape}")
     phen_df.index = phen_df.index.astype(str).str.strip()
 
@@ -23,7 +23,9 @@ def main():
     logger.info(f"Classical ML preprocessing complete. X shape: {X.shape}, classes: {class_names}")
 
     logger.info("Preparing data for federated learning...")
-    client_datasets, num_features, num_classes = load_and_partition_data(protein_df, phen_df)
+    # Reuse the balanced arrays from above instead of re-running
+    # impute/scale/SMOTE on the same frames
+    client_datasets, num_features, num_classes = load_and_partition_data(protein_df, phen_df, preprocessed=(X, y))
     logger.info(f"Created {len(client_datasets)} client datasets with {num_features} features and {num_classes} classes")
 
     valid_client_ids = [str(i) for i, data_obj in enumerate(client_datasets) 
@@ -1,6 +1,8 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch import Tensor
+from typing import Optional
 from torch_geometric.nn import SAGEConv
 
 
@@ -14,13 +16,36 @@ class SAGENet(nn.Module):
         self.out = nn.Linear(hidden_dim, out_dim)
         self.dropout = dropout
 
-    def forward(self, x, edge_index=None, return_embeddings=False):
+    def _mlp_forward(self, x: Tensor) -> Tensor:
+        """MLP-mode path used when no graph is available: plain lin_l + BN chains."""
+        h = F.relu(self.bn1(self.conv1.lin_l(x)))
+        h = F.dropout(h, p=self.dropout, training=self.training)
+        h = F.relu(self.bn2(self.conv2.lin_l(h))) + h
+        h = F.dropout(h, p=self.dropout, training=self.training)
+        return h
+
+    def _mlp_fallback(self):
+        """Compile the MLP path once (Inductor fuses BN+ReLU+add+dropout) and cache it."""
+        compiled = getattr(self, "_mlp_compiled", None)
+        if compiled is None:
+            try:
+                compiled = torch.compile(self._mlp_forward, dynamic=True)
+            except Exception:
+                # Older torch or unsupported backend: fall back to eager
+                compiled = self._mlp_forward
+            self._mlp_compiled = compiled
+        return compiled
+
+    def forward(self, x: Tensor, edge_index: Optional[Tensor] = None, return_embeddings: bool = False) -> Tensor:
         # Handle cases where edge_index might be None or empty due to small client datasets
         if edge_index is None or edge_index.numel() == 0:
-            h = F.relu(self.bn1(self.conv1.lin_l(x)))
-            h = F.dropout(h, p=self.dropout, training=self.training)
-            h = F.relu(self.bn2(self.conv2.lin_l(h))) + h
-            h = F.dropout(h, p=self.dropout, training=self.training)
+            try:
+                h = self._mlp_fallback()(x)
+            except Exception:
+                # torch.compile defers backend errors to the first call;
+                # pin eager from here on if that happens
+                self._mlp_compiled = self._mlp_forward
+                h = self._mlp_forward(x)
         else:
             h = F.relu(self.bn1(self.conv1(x, edge_index)))
             h = F.dropout(h, p=self.dropout, training=self.training)
@@ -1,37 +1,132 @@
 import torch
 import logging
+import weakref
 import torch.nn as nn
 import torch.nn.functional as F
 import numpy as np
 import flwr as fl
-from sklearn.metrics import accuracy_score, roc_auc_score
-from sklearn.preprocessing import label_binarize
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from flwr.common import Parameters
+from torch_geometric.data import Data
+from torch_geometric.loader import NeighborLoader
 
 from config.settings import Config
 from models.gnn_model import SAGENet
 from data.loader import DataObj
+from utils.metrics import binary_auroc, multiclass_auroc
 from utils.logging_utils import configure_logging
 
 configure_logging()
 logger = logging.getLogger(__name__)
 
+# Flower re-instantiates FlowerClient every round, so model + optimizer are
+# cached here per client id instead of being rebuilt (parameter init kernels
+# and fresh Adam state buffers) N_rounds times
+_CLIENT_STATE: Dict[int, Tuple[SAGENet, torch.optim.Optimizer, "weakref.ref"]] = {}
+
+def _client_state(client_id: int, num_features: int, num_classes: int, data: DataObj) -> Tuple[SAGENet, torch.optim.Optimizer]:
+    """Return the persistent (model, optimizer) pair for a client, building it once.
+
+    Each entry remembers which DataObj it was built against: the neighbor
+    loader and any captured CUDA graph hanging off the model bake in that
+    run's tensors, so reuse is only safe while the same partition is in
+    play. A repartition (new DataObj) rebuilds the pair from scratch.
+    """
+    cached = _CLIENT_STATE.get(client_id)
+    if cached is not None:
+        model, optimizer, data_ref = cached
+        if (data_ref() is data
+                and model.conv1.lin_l.in_features == num_features
+                and model.out.out_features == num_classes):
+            return model, optimizer
+    model = SAGENet(num_features, Config.hidden_dim, num_classes, Config.dropout).to(Config.device)
+    # capturable=True keeps Adam's step counter on-device, a prerequisite
+    # for replaying the optimizer step inside a CUDA graph
+    optimizer = torch.optim.Adam(model.parameters(), lr=Config.learning_rate,
+                                 weight_decay=Config.weight_decay,
+                                 capturable=torch.cuda.is_available())
+    _CLIENT_STATE[client_id] = (model, optimizer, weakref.ref(data))
+    return model, optimizer
+
 class FlowerClient(fl.client.NumPyClient):
     def __init__(self, client_id: int, data: DataObj, num_features: int, num_classes: int):
         self.client_id = client_id
         self.data = data
         self.num_features = num_features
         self.num_classes = num_classes
-        self.model = SAGENet(num_features, Config.hidden_dim, num_classes, Config.dropout).to(Config.device)
-        
+        self.model, self.optimizer = _client_state(client_id, num_features, num_classes, data)
+
         self.criterion = nn.CrossEntropyLoss(weight=self.data.class_weights)
-        self.optimizer = torch.optim.Adam(self.model.parameters(), lr=Config.learning_rate, weight_decay=Config.weight_decay)
-        
-        self.can_train = self.data.train_mask.sum().item() > 0
-        self.can_evaluate = self.data.val_mask.sum().item() > 0
+        # Keep the fresh-optimizer-per-round semantics of the old code by
+        # zeroing the Adam moments/step in place; in-place (rather than
+        # reassigning optimizer.state) preserves the tensor storages a
+        # captured CUDA graph points at
+        for state in self.optimizer.state.values():
+            for value in state.values():
+                if torch.is_tensor(value):
+                    value.zero_()
+
+        # The captured training-step graph lives on the persistent model so
+        # it survives across FlowerClient instantiations
+        self._train_graph = getattr(self.model, "_train_graph", None)
+        self._graph_loss = getattr(self.model, "_graph_loss", None)
+
+        # Per-client shapes are fixed, so compile with dynamic=False and let
+        # Inductor specialize + fuse the BN/ReLU/dropout/residual chain. The
+        # wrapper is stashed in the model's plain __dict__ via object.__setattr__:
+        # nn.Module.__setattr__ would register the OptimizedModule as a child
+        # module, making the module graph cyclic (its _orig_mod is this model)
+        # and sending state_dict() into infinite recursion
+        self._forward = getattr(self.model, "_compiled_train", None)
+        if self._forward is None:
+            try:
+                self._forward = torch.compile(self.model, dynamic=False, mode="reduce-overhead")
+            except Exception:
+                # Older torch or unsupported backend: fall back to eager
+                self._forward = self.model
+            object.__setattr__(self.model, "_compiled_train", self._forward)
+
+        # BF16 autocast keeps FP32 master weights and needs no GradScaler;
+        # only worthwhile (or supported) on CUDA devices with native BF16
+        self.use_autocast = Config.device == "cuda" and torch.cuda.is_bf16_supported()
+
+        self.can_train = self.data.has_train
+        self.can_evaluate = self.data.has_val
+
+        # Boolean-mask indexing launches a fresh gather and allocation every
+        # use; precompute the integer indices and gathered targets once
+        self._train_idx = self.data.train_mask.nonzero(as_tuple=True)[0]
+        self._y_train = self.data.y.index_select(0, self._train_idx)
+        self._val_idx = self.data.val_mask.nonzero(as_tuple=True)[0]
+        self._y_val = self.data.y.index_select(0, self._val_idx)
         self.has_graph_data = (self.data.edge_index is not None and self.data.edge_index.numel() > 0)
 
+        # For large clients a full-graph forward recomputes embeddings for
+        # every node each epoch; sample the 2-hop subgraph around train nodes
+        # instead so FLOPs scale with |train| * fanout^2 rather than |V|
+        self.train_loader = getattr(self.model, "_train_loader", None)
+        if (self.train_loader is None and self.can_train and self.has_graph_data
+                and self.data.x.size(0) >= Config.neighbor_sampling_threshold):
+            # Sampling runs on CPU, so the loader keeps CPU copies; batches
+            # are moved to the device inside the training loop
+            try:
+                self.train_loader = NeighborLoader(
+                    Data(x=self.data.x.cpu(), edge_index=self.data.edge_index.cpu(), y=self.data.y.cpu()),
+                    input_nodes=self.data.train_mask.cpu(),
+                    num_neighbors=[Config.n_neighbors_graph] * 2,
+                    batch_size=Config.batch_size,
+                    shuffle=True,
+                )
+                self.model._train_loader = self.train_loader
+                logger.info(f"Client {self.client_id}: Using neighbor sampling "
+                            f"({self.data.x.size(0)} nodes >= {Config.neighbor_sampling_threshold}).")
+            except ImportError as e:
+                # Neighbor sampling needs pyg-lib or torch-sparse, neither of
+                # which requirements.txt pins; full-batch training still works
+                logger.warning(f"Client {self.client_id}: Neighbor sampling unavailable ({e}). "
+                               "Falling back to full-batch training.")
+                self.train_loader = None
+
         if not self.can_train:
             logger.warning(f"Client {self.client_id}: No training samples available. `fit` will be skipped.")
         if not self.can_evaluate:
@@ -41,13 +136,103 @@ class FlowerClient(fl.client.NumPyClient):
 
     def get_parameters(self, config: Dict) -> Parameters:
         """Returns the current model parameters as a list of NumPy ndarrays."""
-        return [val.cpu().numpy() for _, val in self.model.state_dict().items()]
+        # Queue all D2H copies first, then sync once instead of per tensor
+        params = [val.detach().to("cpu", non_blocking=True) for val in self.model.state_dict().values()]
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        return [p.numpy() for p in params]
 
     def set_parameters(self, parameters: List[np.ndarray]) -> None:
         """Sets the model parameters from a list of NumPy ndarrays."""
-        params_dict = zip(self.model.state_dict().keys(), parameters)
-        state_dict = {k: torch.tensor(v).to(Config.device) for k, v in params_dict}
-        self.model.load_state_dict(state_dict, strict=True)
+        # torch.from_numpy views the Flower buffers without a host copy and
+        # copy_ writes straight into the existing tensors — keeping parameter
+        # storages stable, which the Adam state and any captured CUDA graph
+        # rely on (load_state_dict(assign=True) would orphan both)
+        state_dict = self.model.state_dict()
+        with torch.no_grad():
+            for key, value in zip(state_dict.keys(), parameters):
+                state_dict[key].copy_(torch.from_numpy(np.ascontiguousarray(value)), non_blocking=True)
+
+    def _model_forward(self, x, edge_index):
+        """Run the compiled forward; Dynamo defers backend errors to the first call, so pin eager then."""
+        if self._forward is self.model:
+            return self.model(x, edge_index)
+        try:
+            return self._forward(x, edge_index)
+        except Exception as e:
+            logger.warning(f"Client {self.client_id}: Compiled forward failed ({e}). Reverting to eager.")
+            self._forward = self.model
+            object.__setattr__(self.model, "_compiled_train", self.model)
+            return self.model(x, edge_index)
+
+    def _train_step(self):
+        """One full-batch forward/backward/step; shared by the eager loop and graph capture."""
+        self.optimizer.zero_grad(set_to_none=False)
+        with torch.autocast(device_type="cuda", dtype=torch.bfloat16,
+                            enabled=self.use_autocast, cache_enabled=False):
+            out = self._model_forward(self.data.x, self.data.edge_index)
+            loss = self.criterion(out.index_select(0, self._train_idx), self._y_train)
+        loss.backward()
+        self.optimizer.step()
+        return loss
+
+    def _fit_sampled(self, local_epochs: int) -> float:
+        """Mini-batch training over sampled subgraphs; seed nodes come first in each batch."""
+        train_loss = float("nan")
+        for epoch in range(local_epochs):
+            for batch in self.train_loader:
+                batch = batch.to(Config.device)
+                self.optimizer.zero_grad(set_to_none=True)
+                with torch.autocast(device_type="cuda", dtype=torch.bfloat16, enabled=self.use_autocast):
+                    out = self._model_forward(batch.x, batch.edge_index)
+                    loss = self.criterion(out[:batch.batch_size], batch.y[:batch.batch_size])
+                loss.backward()
+                self.optimizer.step()
+                train_loss = loss.item()
+        return train_loss
+
+    def _fit_cuda_graph(self, local_epochs: int) -> Optional[float]:
+        """Train via CUDA graph replay, capturing the step graph on first use.
+
+        The per-epoch step relaunches dozens of sub-100us kernels from Python;
+        capturing it once and replaying removes that dispatch overhead. The
+        inputs (x, edge_index, y, masks) are static across epochs and rounds,
+        and set_parameters copies new weights into the existing tensors, so a
+        single capture stays valid for the whole simulation. Returns the final
+        loss, or None if capture is unsupported so the caller falls back.
+        """
+        replays = local_epochs
+        warmup_loss = None
+        if self._train_graph is None:
+            try:
+                # Warmup iterations (real steps, on a side stream) let cuDNN /
+                # autograd finish lazy initialization outside capture
+                warmup = min(2, local_epochs)
+                side_stream = torch.cuda.Stream()
+                side_stream.wait_stream(torch.cuda.current_stream())
+                with torch.cuda.stream(side_stream):
+                    for _ in range(warmup):
+                        warmup_loss = self._train_step()
+                torch.cuda.current_stream().wait_stream(side_stream)
+                replays = local_epochs - warmup
+
+                graph = torch.cuda.CUDAGraph()
+                with torch.cuda.graph(graph):
+                    self._graph_loss = self._train_step()
+                self._train_graph = graph
+                self.model._train_graph = graph
+                self.model._graph_loss = self._graph_loss
+            except Exception as e:
+                logger.warning(f"Client {self.client_id}: CUDA graph capture failed ({e}). Falling back to eager training.")
+                self._train_graph = False
+                self.model._train_graph = False
+        if self._train_graph is False:
+            return None
+
+        for _ in range(replays):
+            self._train_graph.replay()
+        loss = self._graph_loss if replays > 0 else warmup_loss
+        return float(loss.item())
 
     def fit(self, parameters: List[np.ndarray], config: Dict) -> Tuple[List[np.ndarray], int, Dict]:
         """Trains the model locally on the client's data."""
@@ -61,14 +246,21 @@ class FlowerClient(fl.client.NumPyClient):
         self.model.train()
         train_loss = float("nan") # Default value
         
-        if self.data.train_mask.sum().item() > 0:
-            for epoch in range(local_epochs):
-                self.optimizer.zero_grad()
-                out = self.model(self.data.x, self.data.edge_index)
-                loss = self.criterion(out[self.data.train_mask], self.data.y[self.data.train_mask])
-                loss.backward()
-                self.optimizer.step()
-                train_loss = loss.item()
+        if self.can_train:
+            graph_loss = None
+            # The manual CUDA-graph path only applies to the eager model;
+            # reduce-overhead compilation already wraps steps in CUDA graphs
+            if (self.train_loader is None and Config.device == "cuda"
+                    and self._forward is self.model and local_epochs > 0):
+                graph_loss = self._fit_cuda_graph(local_epochs)
+            if self.train_loader is not None:
+                train_loss = self._fit_sampled(local_epochs)
+            elif graph_loss is not None:
+                train_loss = graph_loss
+            else:
+                for epoch in range(local_epochs):
+                    loss = self._train_step()
+                    train_loss = loss.item()
             logger.info(f"Client {self.client_id}: Training complete, final train loss: {train_loss:.4f}")
         else:
             logger.warning(f"Client {self.client_id}: No samples in training mask, skipping training loop.")
@@ -95,36 +287,29 @@ class FlowerClient(fl.client.NumPyClient):
             return float("nan"), 0, {"accuracy": float("nan"), "roc_auc": float("nan"), "loss": float("nan")}
 
         with torch.no_grad():
-            out = self.model(self.data.x, self.data.edge_index)
-            
-            # Loss calculation
-            val_loss = self.criterion(out[self.data.val_mask], self.data.y[self.data.val_mask]).item()
-
-            # Accuracy calculation
-            preds = out[self.data.val_mask].argmax(dim=1)
-            targets = self.data.y[self.data.val_mask]
-            accuracy = accuracy_score(targets.cpu(), preds.cpu())
-
-            # ROC AUC calculation
-            if self.num_classes > 2:
-                if len(np.unique(targets.cpu())) > 1 and len(targets) >= 2: 
-                    targets_binarized = label_binarize(targets.cpu(), classes=range(self.num_classes))
-                    preds_softmax = F.softmax(out[self.data.val_mask], dim=1).cpu().numpy()
-                    try:
-                        roc_auc = roc_auc_score(targets_binarized, preds_softmax, multi_class='ovr')
-                    except ValueError as e:
-                        logger.warning(f"Client {self.client_id}: ROC AUC multi-class error: {e}. Unique targets: {np.unique(targets.cpu())}. Returning NaN.")
-                else:
-                    logger.warning(f"Client {self.client_id}: Only one class or too few samples ({len(targets)}) present in validation targets for multi-class AUC. Unique targets: {np.unique(targets.cpu())}. Returning NaN.")
-            elif self.num_classes == 2:
-                if len(np.unique(targets.cpu())) > 1 and len(targets) >= 2:
-                    preds_softmax_positive = F.softmax(out[self.data.val_mask], dim=1)[:, 1].cpu().numpy()
-                    try:
-                        roc_auc = roc_auc_score(targets.cpu(), preds_softmax_positive)
-                    except ValueError as e:
-                        logger.warning(f"Client {self.client_id}: ROC AUC binary error: {e}. Unique targets: {np.unique(targets.cpu())}. Returning NaN.")
-                else:
-                    logger.warning(f"Client {self.client_id}: Only one class or too few samples ({len(targets)}) present in validation targets for binary AUC. Unique targets: {np.unique(targets.cpu())}. Returning NaN.")
+            with torch.autocast(device_type="cuda", dtype=torch.bfloat16, enabled=self.use_autocast):
+                out = self._model_forward(self.data.x, self.data.edge_index)
+            # Gather the validation rows once and reuse the slice for loss,
+            # argmax and softmax instead of re-masking per metric
+            out_val = out.float().index_select(0, self._val_idx)
+            targets = self._y_val
+
+            val_loss = self.criterion(out_val, targets).item()
+
+            # Accuracy and ROC AUC stay on-device; sklearn's versions forced
+            # a CUDA sync per .cpu() call and then ran single-threaded
+            preds = out_val.argmax(dim=1)
+            accuracy = (preds == targets).float().mean().item()
+
+            if self.num_classes >= 2:
+                probs = F.softmax(out_val, dim=1)
+                try:
+                    if self.num_classes > 2:
+                        roc_auc = multiclass_auroc(probs, targets, self.num_classes)
+                    else:
+                        roc_auc = binary_auroc(probs[:, 1], targets)
+                except ValueError as e:
+                    logger.warning(f"Client {self.client_id}: ROC AUC error: {e}. Returning NaN.")
             else:
                 logger.warning(f"Client {self.client_id}: Cannot calculate ROC AUC for single class (num_classes={self.num_classes}). Returning NaN.")
 
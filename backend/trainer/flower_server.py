@@ -16,6 +16,16 @@ from utils.logging_utils import configure_logging
 configure_logging()
 logger = logging.getLogger(__name__)
 
+# Skip the per-storage CRC32 pass and stage CUDA tensors through pinned
+# memory when serializing; applies to the torch.save in save_federated_model
+try:
+    from torch.serialization import config as _serialization_config
+    _serialization_config.save.compute_crc32 = False
+    _serialization_config.save.use_pinned_memory_for_d2h = True
+except (ImportError, AttributeError):
+    # Older torch without the serialization config knobs
+    pass
+
 def fit_config(server_round: int) -> Dict[str, Scalar]:
     """Return a configuration for the current round."""
     config = {
@@ -33,34 +43,35 @@ def evaluate_config(server_round: int) -> Dict[str, Scalar]:
     logger.info(f"Server: Configuring evaluation for round {server_round}.")
     return config
 
+_AGGREGATED_METRIC_KEYS = ("accuracy", "loss", "roc_auc")
+
 def evaluate_metrics_aggregation(metrics: List[Tuple[int, Dict]]) -> Dict[str, Scalar]:
     """Aggregate metrics from clients, weighted by number of examples."""
-    accuracies = []
-    losses = []
-    roc_aucs = []
-    total_examples = 0
+    if not metrics:
+        return {}
 
+    # Single pass with one dict lookup per metric; value == value is a NaN
+    # test that skips the numpy ufunc dispatch entirely, which adds up at
+    # large client counts
+    per_metric = {key: ([], []) for key in _AGGREGATED_METRIC_KEYS}
     for num_examples, m in metrics:
-        if num_examples > 0:
-            total_examples += num_examples
-            if not np.isnan(m.get("accuracy", float("nan"))):
-                accuracies.append(num_examples * m["accuracy"])
-            if not np.isnan(m.get("loss", float("nan"))):
-                losses.append(num_examples * m["loss"])
-            if not np.isnan(m.get("roc_auc", float("nan"))):
-                roc_aucs.append(num_examples * m["roc_auc"])
-        else:
-            logger.warning(f"Server: Skipping client metrics with 0 examples or NaN values.")
+        if num_examples <= 0:
+            logger.warning(f"Server: Skipping client metrics with 0 examples.")
+            continue
+        for key in _AGGREGATED_METRIC_KEYS:
+            value = m.get(key)
+            if value is not None and value == value:
+                values, weights = per_metric[key]
+                values.append(value)
+                weights.append(num_examples)
 
     aggregated_metrics = {}
-    if total_examples > 0:
-        if accuracies:
-            aggregated_metrics["accuracy"] = sum(accuracies) / total_examples
-        if losses:
-            aggregated_metrics["loss"] = sum(losses) / total_examples
-        if roc_aucs:
-            aggregated_metrics["roc_auc"] = sum(roc_aucs) / total_examples
-    
+    for key, (values, weights) in per_metric.items():
+        if values:
+            # np.average runs the weighted mean in C and normalizes in one
+            # pass, avoiding the intermediate products of a Python reduction
+            aggregated_metrics[key] = float(np.average(values, weights=weights))
+
     logger.info(f"Server: Aggregated evaluation metrics: {aggregated_metrics}")
     return aggregated_metrics
 
@@ -99,12 +110,14 @@ def save_federated_model(strategy, client_datasets: List[DataObj], num_features:
             dummy_client = FlowerClient(0, client_datasets[0], num_features, num_classes)
             final_parameters = dummy_client.get_parameters({})
         
-        # Create a temporary model instance to load the parameters
-        temp_model = SAGENet(num_features, Config.hidden_dim, num_classes, Config.dropout).to(Config.device)
-        
-        # Convert parameters back to tensors and load into model
+        # Create a temporary model instance to load the parameters. It only
+        # restructures the ndarrays for torch.save, so it stays on the CPU —
+        # torch.from_numpy wraps the Flower buffers without copying, where the
+        # old torch.tensor(v).to(device) copied twice just to serialize back out
+        temp_model = SAGENet(num_features, Config.hidden_dim, num_classes, Config.dropout)
+
         params_dict = zip(temp_model.state_dict().keys(), final_parameters)
-        state_dict = {k: torch.tensor(v).to(Config.device) for k, v in params_dict}
+        state_dict = {k: torch.from_numpy(np.ascontiguousarray(v)) for k, v in params_dict}
         temp_model.load_state_dict(state_dict, strict=True)
         
         # Save the model
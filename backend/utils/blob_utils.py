@@ -1,48 +1,111 @@
 import os
+import mmap
 import requests
 import logging
 import json
+import threading
 import vercel_blob
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from utils.logging_utils import configure_logging
 from config.settings import Config
 
 configure_logging()
 logger = logging.getLogger(__name__)
 
+# Singleflight state: concurrent requests for the same blob_key share one
+# download instead of racing N identical transfers
+_download_locks: defaultdict = defaultdict(threading.Lock)
+_resolved_paths: dict = {}
+
+# Shared session with a sized connection pool: keep-alive skips the TLS
+# handshake that otherwise precedes every blob call
+_session = requests.Session()
+_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=16))
+
 def download_file_from_blob(blob_key: str, dest_local_path: str) -> None:
     logger.info(f"Downloading blob file with key: {blob_key}")
-    response = vercel_blob.download_file(f"{Config.vercel_blob_store_url}/{blob_key}", dest_local_path)
+    url = f"{Config.vercel_blob_store_url}/{blob_key}"
+    etag_path = f"{dest_local_path}.etag"
+
+    # Conditional GET: when we still hold the bytes and their ETag, a 304
+    # costs one header-sized round trip instead of the full body
+    headers = {}
+    if Config.vercel_blob_token:
+        headers["Authorization"] = f"Bearer {Config.vercel_blob_token}"
+    if os.path.exists(dest_local_path) and os.path.exists(etag_path):
+        with open(etag_path, "r", encoding="utf-8") as f:
+            etag = f.read().strip()
+        if etag:
+            headers["If-None-Match"] = etag
+
+    response = _session.get(url, headers=headers, stream=True, timeout=60)
+    if response.status_code == 304:
+        logger.info(f"Blob {blob_key} unchanged (ETag match), using cached copy at {dest_local_path}")
+        return
+    response.raise_for_status()
 
     os.makedirs(os.path.dirname(dest_local_path), exist_ok=True)
 
     with open(dest_local_path, "wb") as f:
-        for chunk in response.iter_content(chunk_size=8192):
+        # 1 MiB chunks keep the Python-level loop overhead negligible
+        for chunk in response.iter_content(chunk_size=1 << 20):
             if chunk:
                 f.write(chunk)
 
+    etag = response.headers.get("ETag")
+    if etag:
+        with open(etag_path, "w", encoding="utf-8") as f:
+            f.write(etag)
+
     logger.info(f"Successfully downloaded blob file {blob_key} to {dest_local_path}")
 
 
 def load_file_from_blob_if_needed(blob_key: str, dest_local_path: str) -> str:
-    
+
+    cached = _resolved_paths.get(blob_key)
+    if cached is not None and os.path.exists(cached):
+        return cached
+
     if os.path.exists(dest_local_path):
         logger.debug(f"File found locally: {dest_local_path}")
+        _resolved_paths[blob_key] = dest_local_path
         return dest_local_path
-    
-    logger.info(f"File not found locally, downloading from blob: {blob_key}")
-    try:
-        download_file_from_blob(blob_key, str(dest_local_path))
-        logger.info(f"Successfully cached {blob_key} to {dest_local_path}")
-        return dest_local_path
-    except Exception as e:
-        logger.error(f"Failed to download {blob_key} to {dest_local_path}: {str(e)}")
-        raise
+
+    with _download_locks[blob_key]:
+        # Another thread may have completed the download while we waited
+        cached = _resolved_paths.get(blob_key)
+        if cached is not None and os.path.exists(cached):
+            return cached
+        if os.path.exists(dest_local_path):
+            _resolved_paths[blob_key] = dest_local_path
+            return dest_local_path
+
+        logger.info(f"File not found locally, downloading from blob: {blob_key}")
+        try:
+            download_file_from_blob(blob_key, str(dest_local_path))
+            logger.info(f"Successfully cached {blob_key} to {dest_local_path}")
+            _resolved_paths[blob_key] = dest_local_path
+            return dest_local_path
+        except Exception as e:
+            logger.error(f"Failed to download {blob_key} to {dest_local_path}: {str(e)}")
+            raise
+
+
+def upload_bytes_to_blob(blob_key: str, data: bytes) -> str:
+    """Upload an in-memory payload, skipping the disk round trip of the file variant."""
+    response = vercel_blob.put(blob_key, data)
+    return response.get("url")
 
 
 def upload_file_to_blob(blob_key: str, dest_local_path: str) -> str:
+    # mmap hands the uploader a zero-copy view served from the page cache,
+    # instead of f.read() doubling peak RSS for multi-hundred-MB checkpoints
     with open(dest_local_path, "rb") as f:
-        response = vercel_blob.put(blob_key, f.read())
-        return response.get("url")
+        if os.fstat(f.fileno()).st_size == 0:
+            return upload_bytes_to_blob(blob_key, b"")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return upload_bytes_to_blob(blob_key, mm)
 
 
 def delete_run_from_blob(run_id: str) -> None:
@@ -50,6 +113,10 @@ def delete_run_from_blob(run_id: str) -> None:
     metadata_blob_key = f"{blob_key}/_train_metadata.json"
     local_metadata_path = Config.model_dir / run_id / "_train_metadata.json"
 
+    # New runs keep all client models in clients_bundle.pt, but runs saved
+    # before the bundle format have per-client blobs; enumerate those from
+    # the run metadata (best effort) so deleting an old run doesn't orphan
+    # them in blob storage
     try:
         if not os.path.exists(local_metadata_path):
             download_file_from_blob(metadata_blob_key, str(local_metadata_path))
@@ -62,9 +129,13 @@ def delete_run_from_blob(run_id: str) -> None:
         logger.warning(f"Could not fetch metadata for run {run_id}: {e}")
         num_clients = 5
 
-    files = ["global_model_manual.pt", "_train_metadata.json", "_divergence_metrics.json"]
+    files = ["global_model_manual.pt", "clients_bundle.pt", "_train_metadata.json", "_divergence_metrics.json"]
     files += [f"client_{i+1}_model.pt" for i in range(num_clients)]
     keys_to_delete = [f"{blob_key}/{fname}" for fname in files]
 
-    for key in keys_to_delete:
-        response = vercel_blob.delete(f"{Config.vercel_blob_store_url}/{key}")
+    # DELETEs are independent network calls; issue them concurrently
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(vercel_blob.delete, f"{Config.vercel_blob_store_url}/{key}")
+                   for key in keys_to_delete]
+        for future in futures:
+            future.result()
@@ -1,17 +1,66 @@
 import torch
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from config.settings import Config
 from models.gnn_model import SAGENet
 from typing import List
 
+def _compiled_forward(model: SAGENet):
+    """torch.compile the model once and cache the compiled callable on it.
+
+    Cached via object.__setattr__ so the OptimizedModule lands in the plain
+    __dict__ instead of being registered as a child module, which would make
+    the module graph cyclic and break state_dict() on the model.
+    """
+    compiled = getattr(model, "_compiled_embed", None)
+    if compiled is None:
+        try:
+            compiled = torch.compile(model, dynamic=True, mode="reduce-overhead")
+        except Exception:
+            # Older torch or unsupported backend: fall back to eager
+            compiled = model
+        object.__setattr__(model, "_compiled_embed", compiled)
+    return compiled
+
+
+# Rows per forward pass: bounds transient device memory for large cohorts
+# while keeping each batch big enough to saturate the GEMMs
+_EMBED_BATCH_SIZE = 8192
+
+
 def extract_patient_embeddings(model: SAGENet, protein_df: pd.DataFrame, feature_cols: List[str]=None) -> pd.DataFrame:
-    
-    input_dim = protein_df.shape[1]
-    X = protein_df.fillna(0.0).values.astype("float32")
-    X_tensor = torch.tensor(X, dtype=torch.float32).to(Config.device)
 
-    with torch.no_grad():
-        embeddings = model(X_tensor, edge_index=None, return_embeddings=True).cpu().numpy()
+    # from_numpy wraps the matrix without the host copy torch.tensor made;
+    # on CUDA each chunk goes through pinned memory for an async H2D copy
+    X = np.ascontiguousarray(protein_df.fillna(0.0).to_numpy(dtype=np.float32))
+    X_tensor = torch.from_numpy(X)
+    num_rows = X.shape[0]
+    use_cuda = torch.cuda.is_available()
+
+    forward = _compiled_forward(model)
+    embeddings_out = None
+    with torch.inference_mode():
+        for start in range(0, num_rows, _EMBED_BATCH_SIZE):
+            chunk = X_tensor[start:start + _EMBED_BATCH_SIZE]
+            if use_cuda:
+                chunk = chunk.pin_memory().to(Config.device, non_blocking=True)
+            else:
+                chunk = chunk.to(Config.device)
+            try:
+                emb = forward(chunk, edge_index=None, return_embeddings=True)
+            except Exception:
+                if forward is model:
+                    raise
+                # Dynamo defers backend errors to the first call (e.g. no C++
+                # toolchain for Inductor); pin eager from here on
+                object.__setattr__(model, "_compiled_embed", model)
+                forward = model
+                emb = forward(chunk, edge_index=None, return_embeddings=True)
+            if embeddings_out is None:
+                embeddings_out = torch.empty((num_rows, emb.shape[1]), dtype=emb.dtype)
+            embeddings_out[start:start + emb.shape[0]].copy_(emb)
 
-    return pd.DataFrame(embeddings, index=protein_df.index)
+    if embeddings_out is None:
+        return pd.DataFrame(index=protein_df.index)
+    return pd.DataFrame(embeddings_out.numpy(), index=protein_df.index)
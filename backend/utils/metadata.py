@@ -1,5 +1,7 @@
+import os
 import json
 import logging
+from functools import lru_cache
 from pathlib import Path
 from config.settings import Config
 from utils.logging_utils import configure_logging
@@ -7,20 +9,33 @@ from utils.logging_utils import configure_logging
 configure_logging()
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=128)
+def _read_metadata_cached(path_str: str, mtime: float) -> dict:
+    """Parse a _train_metadata.json once per (path, mtime); mtime keys out stale entries."""
+    with open(path_str, "r") as f:
+        return json.load(f)
+
+def load_metadata_dict(metadata_path) -> dict:
+    """Return the parsed metadata dict for a run, re-reading only when the file changes."""
+    path_str = str(metadata_path)
+    return _read_metadata_cached(path_str, os.path.getmtime(path_str))
+
 def load_metadata(metadata_path: Path) -> tuple[int, int]:
-    
+
     try:
-        with open(metadata_path, "r") as f:
-            train_metadata = json.load(f)
+        train_metadata = load_metadata_dict(metadata_path)
         # Use default values from config as fallback if a key is missing
-        num_clients_trained = train_metadata.get("num_clients", Config.n_clients) 
+        num_clients_trained = train_metadata.get("num_clients", Config.n_clients)
         num_rounds_trained = train_metadata.get("num_rounds", Config.n_rounds)
     except FileNotFoundError:
         logger.warning(f"Metadata file not found at {metadata_path}. Using default num_clients_trained={Config.n_clients} and num_rounds_trained={Config.n_rounds}.")
+        num_clients_trained, num_rounds_trained = Config.n_clients, Config.n_rounds
     except json.JSONDecodeError:
         logger.error(f"Error decoding JSON from {metadata_path}. Using default num_clients_trained={Config.n_clients} and num_rounds_trained={Config.n_rounds}.")
+        num_clients_trained, num_rounds_trained = Config.n_clients, Config.n_rounds
     except Exception as e:
         logger.error(f"An unexpected error occurred while loading metadata: {e}. Using default num_clients_trained={Config.n_clients} and num_rounds_trained={Config.n_rounds}.")
-    
+        num_clients_trained, num_rounds_trained = Config.n_clients, Config.n_rounds
+
     logger.info(f"Loaded training metadata. Num clients trained: {num_clients_trained}, Num rounds trained: {num_rounds_trained}")
     return num_clients_trained, num_rounds_trained
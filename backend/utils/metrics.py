@@ -1,5 +1,4 @@
 import torch
-import torch.nn.functional as F
 import logging
 from typing import Dict
 from utils.logging_utils import configure_logging
@@ -7,29 +6,94 @@ from utils.logging_utils import configure_logging
 configure_logging()
 logger = logging.getLogger(__name__)
 
+def binary_auroc(probs: torch.Tensor, targets: torch.Tensor) -> float:
+    """
+    Binary ROC AUC via the Mann-Whitney rank statistic, computed entirely
+    on the tensors' device. Ties receive averaged ranks, matching
+    sklearn.metrics.roc_auc_score. Raises ValueError if only one class
+    is present in targets.
+    """
+    probs = probs.flatten()
+    targets = targets.flatten().bool()
+    n = probs.numel()
+    n_pos = targets.sum()
+    n_neg = n - n_pos
+    if n_pos == 0 or n_neg == 0:
+        raise ValueError("Only one class present in targets; ROC AUC is undefined.")
+
+    sorted_probs, order = probs.sort()
+    positions = torch.arange(1, n + 1, dtype=probs.dtype, device=probs.device)
+    # Average the positions of tied scores so ties contribute half a swap
+    _, inverse, counts = torch.unique_consecutive(sorted_probs, return_inverse=True, return_counts=True)
+    group_sums = torch.zeros(counts.numel(), dtype=probs.dtype, device=probs.device)
+    group_sums.index_add_(0, inverse, positions)
+    avg_ranks = group_sums / counts.to(probs.dtype)
+    ranks = torch.empty_like(probs)
+    ranks[order] = avg_ranks[inverse]
+
+    n_pos = n_pos.to(probs.dtype)
+    auc = (ranks[targets].sum() - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg.to(probs.dtype))
+    return auc.item()
+
+def multiclass_auroc(probs: torch.Tensor, targets: torch.Tensor, num_classes: int) -> float:
+    """
+    One-vs-rest macro-averaged ROC AUC on-device, over the classes actually
+    present in targets. Raises ValueError if fewer than two classes appear.
+    """
+    present = torch.unique(targets)
+    if present.numel() < 2:
+        raise ValueError("Fewer than two classes present in targets; ROC AUC is undefined.")
+    scores = [binary_auroc(probs[:, c], targets == c) for c in present.tolist()]
+    return float(sum(scores) / len(scores))
+
+# Memoized per layer schema: the state_dict layout is static across clients
+# and rounds, so the comparable-layer list and segment offsets only need
+# building once
+_schema_cache: Dict[tuple, tuple] = {}
+_segment_ids_cache: Dict[tuple, torch.Tensor] = {}
+
 def calculate_model_divergence(model1_state_dict: Dict[str, torch.Tensor], model2_state_dict: Dict[str, torch.Tensor]) -> Dict[str, float]:
     """
     Calculates the cosine divergence (1 - cosine similarity) between corresponding layers
     of two model state dictionaries.
+
+    All comparable layers are flattened into two concatenated vectors and the
+    per-layer dot products come from one segment reduction each, instead of a
+    cosine_similarity launch plus .item() sync per layer.
     """
-    divergence_scores = {}
-    for (name1, param1) in model1_state_dict.items():
-        if name1 in model2_state_dict:
-            param2 = model2_state_dict[name1]
-            # Ensure tensors are not scalar and have the same number of dimensions
-            if param1.dim() > 0 and param2.dim() > 0 and param1.shape == param2.shape:
-                # Flatten tensors for cosine similarity calculation
-                v1 = param1.flatten()
-                v2 = param2.flatten()
-
-                # Handle cases where flattened vectors might be zero, causing NaN in cosine similarity
-                if torch.norm(v1) == 0 or torch.norm(v2) == 0:
-                    divergence_scores[name1] = 1.0 # Max divergence if one is zero vector
-                else:
-                    cosine_sim = F.cosine_similarity(v1, v2, dim=0)
-                    divergence_scores[name1] = (1 - cosine_sim.item())
-            else:
-                logger.debug(f"Skipping divergence for layer {name1} due to non-tensor, scalar, or shape mismatch.")
-        else:
-            logger.debug(f"Layer {name1} in model1 not found in model2 for divergence calculation.")
-    return divergence_scores
\ No newline at end of file
+    schema_key = (tuple(model1_state_dict.keys()), tuple(model2_state_dict.keys()))
+    schema = _schema_cache.get(schema_key)
+    if schema is None:
+        names = [
+            name for name, param in model1_state_dict.items()
+            if name in model2_state_dict and param.dim() > 0
+            and model2_state_dict[name].dim() > 0 and param.shape == model2_state_dict[name].shape
+        ]
+        lengths = [model1_state_dict[name].numel() for name in names]
+        schema = (names, lengths)
+        _schema_cache[schema_key] = schema
+    names, lengths = schema
+    if not names:
+        return {}
+
+    a = torch.cat([model1_state_dict[name].detach().reshape(-1).float() for name in names])
+    b = torch.cat([model2_state_dict[name].detach().reshape(-1).float() for name in names])
+
+    cache_key = (tuple(zip(names, lengths)), str(a.device))
+    segment_ids = _segment_ids_cache.get(cache_key)
+    if segment_ids is None:
+        segment_ids = torch.repeat_interleave(
+            torch.arange(len(names), device=a.device),
+            torch.tensor(lengths, device=a.device),
+        )
+        _segment_ids_cache[cache_key] = segment_ids
+
+    num_layers = len(names)
+    ab = torch.zeros(num_layers, device=a.device).index_add_(0, segment_ids, a * b)
+    aa = torch.zeros(num_layers, device=a.device).index_add_(0, segment_ids, a * a)
+    bb = torch.zeros(num_layers, device=a.device).index_add_(0, segment_ids, b * b)
+
+    # Zero vectors get cosine 0 here, i.e. max divergence 1.0 as before
+    denom = aa.sqrt() * bb.sqrt()
+    cosine_sim = torch.where(denom > 0, ab / denom, torch.zeros_like(ab))
+    return dict(zip(names, (1 - cosine_sim).tolist()))
\ No newline at end of file
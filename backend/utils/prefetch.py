@@ -0,0 +1,45 @@
+import os
+import mmap
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from utils.logging_utils import configure_logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="prefetch")
+_prefetched_dirs = set()
+
+
+def _mmap_populate(filepath: Path) -> None:
+    """Map a file with MAP_POPULATE so the kernel faults its pages into the page cache."""
+    try:
+        with open(filepath, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            flags = mmap.MAP_PRIVATE | getattr(mmap, "MAP_POPULATE", 0)
+            mm = mmap.mmap(f.fileno(), size, flags=flags, prot=mmap.PROT_READ)
+            mm.close()
+    except (OSError, ValueError) as e:
+        logger.debug(f"Prefetch skipped for {filepath}: {e}")
+
+
+def prefetch_dir(path) -> None:
+    """Warm the page cache for all checkpoints in a directory, in parallel.
+
+    Subsequent torch.load calls then read from RAM instead of stalling on
+    sequential disk reads. Safe to call repeatedly; each directory is only
+    prefetched once per process.
+    """
+    path = Path(path)
+    if not path.is_dir() or str(path) in _prefetched_dirs:
+        return
+    _prefetched_dirs.add(str(path))
+
+    checkpoints = [p for p in path.iterdir() if p.suffix in (".pt", ".pth")]
+    for checkpoint in checkpoints:
+        _executor.submit(_mmap_populate, checkpoint)
+    if checkpoints:
+        logger.info(f"Prefetching {len(checkpoints)} checkpoint(s) under {path}")